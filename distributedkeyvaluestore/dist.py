@@ -1,63 +1,190 @@
 from distributedkeyvaluestore.node import Node
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import concurrent.futures
+from functools import partial
+from itertools import count
+from hashlib import blake2b
 from typing import Optional
-from math import ceil
+import threading
+from time import monotonic
 
 
-class DistributedKeyValueStore():
-    def __init__(self, nodes: list[Node], replication_factor: int):
-        self.nodes: list[Node] = nodes
-        self.replication_factor = min(len(self.nodes), replication_factor)
+def _hash64(data: str) -> int:
+    # stable across processes, unlike hash() which is salted by PYTHONHASHSEED
+    return int.from_bytes(blake2b(data.encode(), digest_size=8).digest(), 'big')
 
-    def _get_primary_node_for_key(self, key: str) -> Node:
-        # consistent hashing could be used here
-        index = abs(hash(key) % len(self.nodes))
-        return self.nodes[index]
 
-    def _get_replica_nodes(self, primary: Node) -> list[Node]:
-        replicas: list[Node] = []
-        if len(self.nodes) == 1 or self.replication_factor <= 1:
-            return replicas
+def _jump(key_hash: int, num_buckets: int) -> int:
+    # Lamping & Veach jump consistent hash: no ring state, and growing from
+    # N to N+1 buckets only moves ~1/(N+1) of the keys (onto the new bucket)
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key_hash = (key_hash * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key_hash >> 33) + 1)))
+    return b
 
-        primary_index = self.nodes.index(primary)
-        for i in range(self.replication_factor):
-            replica_index = (primary_index + i) % len(self.nodes)
-            if not primary_index == replica_index:
-                replicas.append(self.nodes[replica_index])
 
-            if len(replicas) == self.replication_factor - 1:
-                break
+class DistributedKeyValueStore():
+    def __init__(self, nodes: list[Node], replication_factor: int, write_timeout: Optional[float] = 1.0,
+                 max_workers: Optional[int] = None):
+        self.nodes: list[Node] = nodes
+        self.replication_factor = min(len(self.nodes), replication_factor)
+        # keyed by id() since Node subclasses may override __eq__/__hash__
+        self._node_index: dict[int, int] = {id(node): i for i, node in enumerate(self.nodes)}
+        # replicas are the primary's RF-1 successors in the node list. membership is
+        # fixed for the store's lifetime, so each primary's set is built once here
+        wrapped = self.nodes + self.nodes
+        self._replica_table: list[tuple[Node, ...]] = [
+            tuple(wrapped[i + 1:i + self.replication_factor]) for i in range(len(self.nodes))
+        ]
+        self.write_timeout = write_timeout
+        # the pool is shared by every caller of put(); by default it fits 16 concurrent
+        # full fan-outs before writes start queueing behind each other
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or 16 * len(self.nodes))
+        # node_id -> key -> (write seq, value) for writes that node missed, to be
+        # handed off once it recovers. the seq orders writes from this store, so
+        # a late outcome of an older write never overrides a newer one
+        self.hints: dict[int, dict[str, tuple[int, bytes]]] = {}
+        self._hints_lock = threading.Lock()
+        self._write_seq = count()
+        # (node_id, key) -> writes still running, and the newest seq delivered meanwhile
+        self._in_flight: dict[tuple[int, str], int] = {}
+        self._delivered: dict[tuple[int, str], int] = {}
 
-        return list(set(replicas))
+    def _get_primary_node_for_key(self, key: str) -> Node:
+        return self.nodes[_jump(_hash64(key), len(self.nodes))]
+
+    def _get_replica_nodes(self, primary: Node) -> tuple[Node, ...]:
+        return self._replica_table[self._node_index[id(primary)]]
+
+    @staticmethod
+    def _write_succeeded(future: Future) -> bool:
+        return not future.cancelled() and future.exception() is None and bool(future.result())
+
+    @staticmethod
+    def _started_put(node: Node, key: str, value: bytes, started: threading.Event) -> bool:
+        started.set()
+        return node.put(key, value)
+
+    def _begin_write(self, node: Node, key: str):
+        with self._hints_lock:
+            pair = (node.node_id, key)
+            self._in_flight[pair] = self._in_flight.get(pair, 0) + 1
+
+    def _record_write(self, node: Node, key: str, value: bytes, seq: int, succeeded: bool):
+        pair = (node.node_id, key)
+        with self._hints_lock:
+            node_hints = self.hints.get(node.node_id, {})
+            hinted = node_hints.get(key)
+            delivered = self._delivered.get(pair, -1)
+
+            if succeeded:
+                # the node has this write or a newer one, nothing older to hand off
+                if hinted is not None and hinted[0] <= seq:
+                    del node_hints[key]
+                    if not node_hints:
+                        del self.hints[node.node_id]
+                delivered = max(delivered, seq)
+            elif seq > delivered and (hinted is None or hinted[0] < seq):
+                self.hints.setdefault(node.node_id, {})[key] = (seq, value)
+
+            # the newest delivered seq only matters while older writes to the
+            # same node and key can still come back failed
+            remaining = self._in_flight.get(pair, 0) - 1
+            if remaining > 0:
+                self._in_flight[pair] = remaining
+                self._delivered[pair] = delivered
+            else:
+                self._in_flight.pop(pair, None)
+                self._delivered.pop(pair, None)
+
+    def _on_write_done(self, node: Node, key: str, value: bytes, seq: int, future: Future):
+        self._record_write(node, key, value, seq, self._write_succeeded(future))
+
+    def handoff_hints(self, node: Node) -> int:
+        # replays the writes node missed; run it before the node takes new writes
+        # again, since a replay racing a fresh put of the same key could land last
+        with self._hints_lock:
+            node_hints = dict(self.hints.get(node.node_id, {}))
+
+        handed_off = 0
+        for key, (seq, value) in node_hints.items():
+            self._begin_write(node, key)
+            try:
+                succeeded = bool(node.put(key, value))
+            except Exception:
+                succeeded = False
+            self._record_write(node, key, value, seq, succeeded)
+            handed_off += succeeded
+        return handed_off
 
     def get(self, key: str) -> Optional[bytes]:
         primary = self._get_primary_node_for_key(key)
-
-        value = primary.get(key)
-
-        return value
+        targets = (primary, *self._get_replica_nodes(primary))
+
+        # a put can be acknowledged by a quorum that doesn't include the primary,
+        # so nodes that missed the key's last write, or are still applying one,
+        # are asked only after the ones that are caught up
+        with self._hints_lock:
+            behind = {
+                node.node_id for node in targets
+                if key in self.hints.get(node.node_id, {}) or (node.node_id, key) in self._in_flight
+            }
+        for node in sorted(targets, key=lambda node: node.node_id in behind):
+            try:
+                value = node.get(key)
+            except Exception:
+                continue
+            if value is not None:
+                return value
+
+        return None
 
     def put(self, key: str, value: bytes) -> bool:
+        seq = next(self._write_seq)
         primary = self._get_primary_node_for_key(key)
-
-        primary_success = primary.put(key, value)
-        if not primary_success:
-            return False
-
-        replicas = self._get_replica_nodes(primary)
-
-        replica_successes = 0
-        for replica in replicas:
-            replica_success = replica.put(key, value)
-            if not replica_success:
-                # hinted handoff here
-                ...
-            else:
-                replica_successes += 1
-
-        writeQuorum = 1 + ceil((self.replication_factor - 1) / 2)
-        if self.replication_factor == 1:
-            writeQuorum = 1
-
-        overallSuccess = 1 + replica_successes >= writeQuorum
-
-        return overallSuccess
+        targets = (primary, *self._get_replica_nodes(primary))
+
+        write_quorum = 1 if self.replication_factor == 1 else (self.replication_factor // 2) + 1
+
+        for node in targets:
+            self._begin_write(node, key)
+        # the primary is just another vote, so its write doesn't gate the replicas
+        started = [threading.Event() for _ in targets]
+        futures = {
+            self._executor.submit(self._started_put, node, key, value, event): node
+            for node, event in zip(targets, started)
+        }
+        # every write's outcome updates the hints, including stragglers that
+        # finish after put() has returned
+        for future, node in futures.items():
+            future.add_done_callback(partial(self._on_write_done, node, key, value, seq))
+
+        # waiting in the executor queue gets its own write_timeout, so the run-time
+        # budget below isn't eaten by other callers' writes. writes still queued
+        # after that are cancelled and count (and get hinted) as failed votes, so
+        # workers stuck on a hung node can't block put() forever
+        deadline = None if self.write_timeout is None else monotonic() + self.write_timeout
+        for future, event in zip(futures, started):
+            remaining = None if deadline is None else max(0.0, deadline - monotonic())
+            if not event.wait(remaining):
+                future.cancel()
+
+        successes = 0
+        failures = 0
+        try:
+            for future in as_completed(futures, timeout=self.write_timeout):
+                if self._write_succeeded(future):
+                    successes += 1
+                    if successes >= write_quorum:
+                        break
+                else:
+                    failures += 1
+                    if len(targets) - failures < write_quorum:
+                        break
+        # only an alias of the builtin TimeoutError from 3.11 on
+        except concurrent.futures.TimeoutError:
+            pass
+
+        return successes >= write_quorum
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Optional
+import threading
 
 class Node(ABC):
 
@@ -21,25 +22,38 @@ class Node(ABC):
         ...
 
 class KVNode(Node):
+    # power of two so the shard is a mask of the key hash
+    SHARD_COUNT = 16
 
     def __init__(self, node_id: int):
-        self.data: dict[str, bytes] = {}
+        # coordinator writes land here from many threads, so split storage into
+        # independently locked shards instead of one dict behind one lock
+        self._shards: list[dict[str, bytes]] = [{} for _ in range(self.SHARD_COUNT)]
+        self._locks: list[threading.Lock] = [threading.Lock() for _ in range(self.SHARD_COUNT)]
         self._nid = node_id
 
     @property
     def node_id(self):
         return self._nid
 
+    def _shard_for_key(self, key: str) -> int:
+        # hash() is only used within this process, so its per-process salt is fine here
+        return hash(key) & (self.SHARD_COUNT - 1)
+
     def put(self, key: str, value: bytes) -> bool:
         # capacity check maybe?
-        self.data[key] = value
+        s = self._shard_for_key(key)
+        with self._locks[s]:
+            self._shards[s][key] = value
         return True
 
     def get(self, key: str) -> Optional[bytes]:
-        return self.data.get(key)
+        return self._shards[self._shard_for_key(key)].get(key)
 
     def delete(self, key: str) -> bool:
-        if key not in self.data:
-            return False
-        del self.data[key]
-        return True
+        s = self._shard_for_key(key)
+        with self._locks[s]:
+            if key not in self._shards[s]:
+                return False
+            del self._shards[s][key]
+            return True
@@ -1,65 +1,288 @@
-from time import monotonic
+from time import monotonic_ns
 from abc import ABC, abstractmethod
+from multiprocessing import shared_memory
+import multiprocessing
+import struct
 import threading
+import weakref
 from typing import Optional
 import time
 
 class RateLimiter(ABC):
+    __slots__ = ()
 
     @abstractmethod
     def grant_access(self) -> bool:
         ...
 
+# bucket state is all integers: time in microseconds and tokens in units of
+# 1e-12, i.e. one microsecond of a refresh rate given in micro-tokens per
+# second, so every refill is exact and no fraction of a token is dropped
+_US_PER_S = 1_000_000
+_UNITS_PER_TOKEN = _US_PER_S * 1_000_000
+
 class TokenBucketLimiter(RateLimiter):
+    # fixed slots instead of a per-instance __dict__: every attribute read on
+    # the grant path becomes a direct slot load rather than a dict lookup
+    __slots__ = ("capacity", "refresh_rate", "_capacity_units", "_refill_per_us", "_state", "lock")
+
     def __init__(self, capacity: int, refresh_rate: float):
         self.capacity = capacity
         self.refresh_rate = refresh_rate
-        self.current_capacity = capacity
-        self.last_filled = monotonic()
+        self._capacity_units = capacity * _UNITS_PER_TOKEN
+        self._refill_per_us = round(refresh_rate * _US_PER_S)
+        # (token units, last_filled_us) is replaced as a single reference, so a
+        # snapshot is always consistent and the lock is only needed to publish a new one
+        self._state: tuple[int, int] = (self._capacity_units, monotonic_ns() // 1000)
         self.lock = threading.Lock()
 
-    def _refill_bucket(self):
-        now = monotonic()
-        elapsed = now - self.last_filled
+    @property
+    def current_capacity(self) -> int:
+        return self._state[0] // _UNITS_PER_TOKEN
+
+    @property
+    def last_filled(self) -> float:
+        return self._state[1] / _US_PER_S
+
+    def is_full(self) -> bool:
+        # a full bucket is indistinguishable from a freshly created one
+        tokens, last_us = self._state
+        return tokens + (monotonic_ns() // 1000 - last_us) * self._refill_per_us >= self._capacity_units
+
+    def get_current_capacity(self) -> int:
+        # state is only ever replaced whole, so a reader just takes the current
+        # snapshot and never has to wait on (or hold up) grant_access
+        return self.current_capacity
+
+    def grant_access(self) -> bool:
+        return self.grant_access_n(1) == 1
+
+    def grant_access_n(self, n: int) -> int:
+        # admits up to n requests with a single swap, returns how many were granted
+        capacity_units = self._capacity_units
+        # one clock read per request, shared by any CAS retries; a state published
+        # by a racing thread may be slightly newer, which just yields no refill
+        now_us = monotonic_ns() // 1000
+        while True:
+            state = self._state
+            tokens, last_us = state
+
+            # refill is inlined rather than a helper method since it runs on
+            # every request; a full bucket just has its refill time reset
+            if now_us > last_us:
+                tokens += (now_us - last_us) * self._refill_per_us
+                if tokens > capacity_units:
+                    tokens = capacity_units
+                last_us = now_us
+
+            granted = tokens // _UNITS_PER_TOKEN
+            if granted > n:
+                granted = n
+            if granted <= 0:
+                return 0
+
+            # compare-and-swap: the refill math runs outside the lock, and if
+            # another thread published first we retry against its state.
+            # A non-blocking acquire is cheaper than entering the context
+            # manager, so only a contended swap falls back to blocking.
+            if not self.lock.acquire(False):
+                self.lock.acquire()
+            try:
+                if self._state is state:
+                    self._state = (tokens - granted * _UNITS_PER_TOKEN, last_us)
+                    return granted
+            finally:
+                self.lock.release()
+
+    def __repr__(self) -> str:
+            return (f"TokenBucket(capacity={self.capacity}, "
+                    f"tokens_per_second={self.refresh_rate}, "
+                    f"current_tokens={self.current_capacity:.2f}, "
+                    f"last_refill_ts={self.last_filled:.2f})")
+
+# a shared bucket is (token units, last_filled_us) packed at the start of its own
+# 64-byte block, so no other process's hot data ever shares its cache line. the
+# creator's (capacity units, refill per us) follow, so attachers can't disagree
+_SHARED_STATE = struct.Struct("<qq")
+_SHARED_PARAMS = struct.Struct("<qq")
+_SHARED_PARAMS_OFFSET = _SHARED_STATE.size
+_CACHE_LINE = 64
+# the largest capacity whose token units still fit the int64 field
+_SHARED_MAX_CAPACITY = (2 ** 63 - 1) // _UNITS_PER_TOKEN
+
+class SharedTokenBucketLimiter(RateLimiter):
+    # same bucket as TokenBucketLimiter, but the state lives in a named shared
+    # memory block so forked workers draw from one bucket instead of each
+    # getting the full rate. monotonic_ns() is system-wide, so timestamps
+    # written by one process are valid in the others
+    __slots__ = ("capacity", "refresh_rate", "_capacity_units", "_refill_per_us", "_shm", "lock")
+
+    def __init__(self, name: str, capacity: Optional[int] = None, refresh_rate: Optional[float] = None,
+                 lock: Optional["multiprocessing.synchronize.Lock"] = None, create: bool = False):
+        if create and (capacity is None or refresh_rate is None):
+            raise ValueError("creating a shared bucket requires capacity and refresh_rate")
+        if capacity is not None and not 0 <= capacity <= _SHARED_MAX_CAPACITY:
+            raise ValueError(f"shared bucket capacity must be between 0 and {_SHARED_MAX_CAPACITY}")
+        # the creator makes the lock; workers attaching by name must be handed
+        # that same lock, e.g. inherited across fork. a private lock would let
+        # every worker race the others on the shared state
+        if lock is None:
+            if not create:
+                raise ValueError("attaching to an existing bucket requires the creator's lock")
+            lock = multiprocessing.Lock()
+        self.lock = lock
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=_CACHE_LINE)
+
+        try:
+            with self.lock:
+                if create:
+                    capacity_units = capacity * _UNITS_PER_TOKEN
+                    refill_per_us = round(refresh_rate * _US_PER_S)
+                    _SHARED_STATE.pack_into(self._shm.buf, 0, capacity_units, monotonic_ns() // 1000)
+                    _SHARED_PARAMS.pack_into(self._shm.buf, _SHARED_PARAMS_OFFSET, capacity_units, refill_per_us)
+                else:
+                    capacity_units, refill_per_us = _SHARED_PARAMS.unpack_from(self._shm.buf, _SHARED_PARAMS_OFFSET)
+        except BaseException:
+            # don't leave a half-initialised segment behind
+            self._shm.close()
+            if create:
+                self._shm.unlink()
+            raise
+
+        # attachers take the creator's parameters; ones they pass must agree
+        if ((capacity is not None and capacity * _UNITS_PER_TOKEN != capacity_units)
+                or (refresh_rate is not None and round(refresh_rate * _US_PER_S) != refill_per_us)):
+            self._shm.close()
+            raise ValueError(f"shared bucket {name!r} was created with a different capacity or refresh_rate")
 
-        if elapsed > 0:
-            to_add = round(elapsed * self.refresh_rate)
-            self.current_capacity = min(self.capacity, self.current_capacity + to_add)
-            self.last_filled = now
+        self.capacity = capacity_units // _UNITS_PER_TOKEN
+        self.refresh_rate = refresh_rate if refresh_rate is not None else refill_per_us / _US_PER_S
+        self._capacity_units = capacity_units
+        self._refill_per_us = refill_per_us
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def current_capacity(self) -> int:
+        return self.get_current_capacity()
+
+    @property
+    def last_filled(self) -> float:
+        with self.lock:
+            return _SHARED_STATE.unpack_from(self._shm.buf)[1] / _US_PER_S
 
     def get_current_capacity(self) -> int:
-        # read lock
+        # other processes write without the GIL, so even reads need the lock
         with self.lock:
-            return self.current_capacity
+            return _SHARED_STATE.unpack_from(self._shm.buf)[0] // _UNITS_PER_TOKEN
 
     def grant_access(self) -> bool:
+        return self.grant_access_n(1) == 1
+
+    def grant_access_n(self, n: int) -> int:
+        capacity_units = self._capacity_units
+        buf = self._shm.buf
+        now_us = monotonic_ns() // 1000
+        # there's no cross-process CAS to build on, so the whole
+        # read-refill-write runs under the shared lock
         with self.lock:
-            self._refill_bucket()
+            tokens, last_us = _SHARED_STATE.unpack_from(buf)
+
+            if now_us > last_us:
+                tokens += (now_us - last_us) * self._refill_per_us
+                if tokens > capacity_units:
+                    tokens = capacity_units
+                last_us = now_us
 
-            if self.current_capacity > 0:
-                self.current_capacity -= 1
-                return True
-            return False
+            granted = tokens // _UNITS_PER_TOKEN
+            if granted > n:
+                granted = n
+            if granted <= 0:
+                return 0
+
+            _SHARED_STATE.pack_into(buf, 0, tokens - granted * _UNITS_PER_TOKEN, last_us)
+            return granted
+
+    def close(self):
+        # detaches this process; the bucket lives on until unlink()
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
 
     def __repr__(self) -> str:
-            return (f"TokenBucket(capacity={self.capacity}, "
+            return (f"SharedTokenBucket(name={self.name}, "
+                    f"capacity={self.capacity}, "
                     f"tokens_per_second={self.refresh_rate}, "
                     f"current_tokens={self.current_capacity:.2f}, "
                     f"last_refill_ts={self.last_filled:.2f})")
 
 class MultiKeyRateLimiter:
-    def __init__(self, default_capacity: int, default_refresh_rate: float):
-        self.buckets = {}
+    # power of two so the shard is a mask of the key hash
+    SHARD_COUNT = 32
+
+    def __init__(self, default_capacity: int, default_refresh_rate: float,
+                 eviction_interval: Optional[float] = 60.0):
+        # buckets are striped across shards so unrelated keys never contend on one lock
+        self._shards: list[dict[str, TokenBucketLimiter]] = [{} for _ in range(self.SHARD_COUNT)]
+        self._locks: list[threading.Lock] = [threading.Lock() for _ in range(self.SHARD_COUNT)]
         self.default_refresh_rate = default_refresh_rate
         self.default_capacity = default_capacity
-        self.lock = threading.Lock()
+
+        # idle buckets are dropped by a single maintainer thread rather than from
+        # allow_request, so request threads never pile up on eviction work
+        self._stop_eviction = threading.Event()
+        if eviction_interval is not None:
+            threading.Thread(
+                target=self._eviction_loop,
+                args=(weakref.ref(self), self._stop_eviction, eviction_interval),
+                daemon=True,
+            ).start()
+
+    @staticmethod
+    def _eviction_loop(limiter_ref: "weakref.ref[MultiKeyRateLimiter]", stop: threading.Event, interval: float):
+        # only holds a weak reference between passes so the limiter can still be collected
+        while not stop.wait(interval):
+            limiter = limiter_ref()
+            if limiter is None:
+                return
+            limiter.evict_idle_buckets()
+            del limiter
+
+    def evict_idle_buckets(self) -> int:
+        # a full bucket carries no state a new one wouldn't have, so it can go.
+        # a request that fetched it just before removal still consumes from it,
+        # which at worst lets that one request through uncounted
+        evicted = 0
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                idle = [key for key, bucket in shard.items() if bucket.is_full()]
+                for key in idle:
+                    del shard[key]
+            evicted += len(idle)
+        return evicted
+
+    def close(self):
+        self._stop_eviction.set()
+
+    def _shard_for_key(self, key: str) -> int:
+        return hash(key) & (self.SHARD_COUNT - 1)
 
     def _get_or_create_bucket(self, key: str) -> TokenBucketLimiter:
-        with self.lock:
-            if key not in self.buckets:
-                self.buckets[key] = TokenBucketLimiter(self.default_capacity, self.default_refresh_rate)
+        s = self._shard_for_key(key)
+        shard = self._shards[s]
 
-        return self.buckets[key]
+        # dict reads are atomic, so existing buckets are found without locking
+        bucket = shard.get(key)
+        if bucket is not None:
+            return bucket
+
+        with self._locks[s]:
+            if key not in shard:
+                shard[key] = TokenBucketLimiter(self.default_capacity, self.default_refresh_rate)
+            return shard[key]
 
     def allow_request(self, key: str) -> bool:
         bucket = self._get_or_create_bucket(key)
@@ -67,22 +290,24 @@ class MultiKeyRateLimiter:
         return bucket.grant_access()
 
     def bucket_info(self, key: str) -> Optional[str]:
-        with self.lock:
-            if key in self.buckets:
-                bucket = self.buckets[key]
+        # only the lookup touches the map; reading and formatting the bucket
+        # happens without holding any shard lock
+        bucket = self._shards[self._shard_for_key(key)].get(key)
+        if bucket is None:
+            return None
 
-                return f"""
+        return f"""
                     Bucket - {key}
                     Current capacity - {bucket.get_current_capacity()}
                 """
-            return None
 
     def remove_bucket(self, key: str) -> bool:
-        with self.lock:
-            if key not in self.buckets:
+        s = self._shard_for_key(key)
+        with self._locks[s]:
+            if key not in self._shards[s]:
                 return False
 
-            del self.buckets[key]
+            del self._shards[s][key]
             return True
 
 if __name__ == "__main__":
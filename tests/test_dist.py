@@ -0,0 +1,119 @@
+import threading
+import time
+import unittest
+
+from distributedkeyvaluestore.dist import DistributedKeyValueStore
+from distributedkeyvaluestore.node import KVNode
+
+
+class HungNode(KVNode):
+    def __init__(self, node_id: int, release: threading.Event):
+        super().__init__(node_id)
+        self.release = release
+
+    def put(self, key: str, value: bytes) -> bool:
+        self.release.wait()
+        return super().put(key, value)
+
+
+class HungNodeTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.nodes = [KVNode(0), KVNode(1), HungNode(2, self.release)]
+
+    def tearDown(self):
+        # let the stuck workers finish so the executor can shut down
+        self.release.set()
+
+    def test_sequential_puts_stay_bounded_after_pool_fills_with_hung_writes(self):
+        store = DistributedKeyValueStore(self.nodes, 3, write_timeout=0.05)
+
+        # enough puts to park a hung write on every default pool worker
+        for i in range(2 * 16 * len(self.nodes)):
+            start = time.monotonic()
+            store.put(f"key{i}", b"v")
+            self.assertLess(time.monotonic() - start, 1.0, f"put #{i} blocked")
+
+    def test_concurrent_puts_on_small_pool_return(self):
+        store = DistributedKeyValueStore(self.nodes, 3, write_timeout=0.05, max_workers=3)
+
+        threads = [threading.Thread(target=store.put, args=(f"key{i}", b"v")) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=3)
+
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+
+    def test_queued_writes_that_never_start_are_hinted(self):
+        store = DistributedKeyValueStore(self.nodes, 3, write_timeout=0.05, max_workers=1)
+
+        # the primary's write goes first and parks the only worker on the hung
+        # node, so the writes to the other two never start
+        key = next(f"key{i}" for i in range(100)
+                   if store._get_primary_node_for_key(f"key{i}") is self.nodes[2])
+
+        self.assertFalse(store.put(key, b"v"))
+        for node in self.nodes[:2]:
+            self.assertIn(key, store.hints.get(node.node_id, {}))
+
+
+class FlakyNode(KVNode):
+    def __init__(self, node_id: int):
+        super().__init__(node_id)
+        self.failing = False
+
+    def put(self, key: str, value: bytes) -> bool:
+        return not self.failing and super().put(key, value)
+
+    def get(self, key: str):
+        if self.failing:
+            raise ConnectionError("node down")
+        return super().get(key)
+
+
+class SlowNode(KVNode):
+    def put(self, key: str, value: bytes) -> bool:
+        time.sleep(0.2)
+        return super().put(key, value)
+
+
+class ReadYourWritesTest(unittest.TestCase):
+    def _key_with_primary(self, store: DistributedKeyValueStore, node: KVNode) -> str:
+        return next(f"key{i}" for i in range(1000) if store._get_primary_node_for_key(f"key{i}") is node)
+
+    def test_put_acknowledged_without_slow_primary_is_readable(self):
+        nodes = [KVNode(0), KVNode(1), SlowNode(2)]
+        store = DistributedKeyValueStore(nodes, 3)
+        key = self._key_with_primary(store, nodes[2])
+
+        self.assertTrue(store.put(key, b"v"))
+        self.assertEqual(store.get(key), b"v")
+
+    def test_failed_primary_is_one_vote_and_replicas_serve_reads(self):
+        nodes = [KVNode(0), KVNode(1), FlakyNode(2)]
+        store = DistributedKeyValueStore(nodes, 3)
+        key = self._key_with_primary(store, nodes[2])
+
+        self.assertTrue(store.put(key, b"v1"))
+        nodes[2].failing = True
+        self.assertTrue(store.put(key, b"v2"))
+        self.assertEqual(store.get(key), b"v2")
+
+    def test_stale_primary_is_read_after_caught_up_replicas(self):
+        nodes = [KVNode(0), KVNode(1), FlakyNode(2)]
+        store = DistributedKeyValueStore(nodes, 3)
+        key = self._key_with_primary(store, nodes[2])
+
+        store.put(key, b"v1")
+        # the primary answers reads again but still holds v1
+        nodes[2].failing = True
+        store.put(key, b"v2")
+        nodes[2].failing = False
+
+        self.assertEqual(nodes[2].get(key), b"v1")
+        self.assertEqual(store.get(key), b"v2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import uuid
+
+from ratelimiter.tokenbucket import SharedTokenBucketLimiter
+
+
+class SharedTokenBucketParamsTest(unittest.TestCase):
+    def setUp(self):
+        self.bucket = SharedTokenBucketLimiter(f"tb-{uuid.uuid4().hex[:12]}", 3, 1, create=True)
+
+    def tearDown(self):
+        self.bucket.close()
+        self.bucket.unlink()
+
+    def test_attacher_takes_creators_parameters(self):
+        attached = SharedTokenBucketLimiter(self.bucket.name, lock=self.bucket.lock)
+        try:
+            self.assertEqual(attached.capacity, 3)
+            self.assertEqual(attached.refresh_rate, 1.0)
+        finally:
+            attached.close()
+
+    def test_attacher_with_different_parameters_is_rejected(self):
+        with self.assertRaises(ValueError):
+            SharedTokenBucketLimiter(self.bucket.name, 1000, 1000, lock=self.bucket.lock)
+
+        self.assertEqual(self.bucket.grant_access_n(10), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()